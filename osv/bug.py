@@ -39,8 +39,9 @@ def normalize_tag(tag):
 
 
 def normalize_tags(tags):
-  """Normalize tags for fuzzy version searching."""
-  return [normalize_tag(tag) for tag in tags]
+  """Normalize tags for fuzzy version searching, yielding each result."""
+  for tag in tags:
+    yield normalize_tag(tag)
 
 
 def populate_indices(bug):
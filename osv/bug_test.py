@@ -53,7 +53,7 @@ class NormalizeTest(unittest.TestCase):
         '8-0-0-beta4',
         '6-0-0-alpha1',
         '10-0-0-10',
-    ], bug.normalize_tags(tags))
+    ], list(bug.normalize_tags(tags)))
 
 
 if __name__ == '__main__':
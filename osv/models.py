@@ -15,6 +15,7 @@
 
 import datetime
 import enum
+import functools
 import re
 import os
 
@@ -23,7 +24,6 @@ from typing import List
 
 from google.cloud import ndb
 from google.protobuf import json_format
-from google.protobuf import timestamp_pb2
 
 # pylint: disable=relative-beyond-top-level
 from . import bug
@@ -35,6 +35,29 @@ from . import vulnerability_pb2
 
 SCHEMA_VERSION = '1.6.0'
 
+_TOKENIZE_RE = re.compile(r'\W+')
+_LEADING_DIGITS_RE = re.compile(r'^\d+')
+
+# Range type enum mappings, materialized once to avoid enum descriptor lookups
+# when converting to and from Vulnerability protos.
+_RANGE_TYPE_NAME = {
+    value.number: value.name
+    for value in vulnerability_pb2.Range.Type.DESCRIPTOR.values
+}
+_RANGE_TYPE_VALUE = {
+    value.name: value.number
+    for value in vulnerability_pb2.Range.Type.DESCRIPTOR.values
+}
+# Likewise for reference types, which are stored by name.
+_REF_TYPE_NAME = {
+    value.number: value.name
+    for value in vulnerability_pb2.Reference.Type.DESCRIPTOR.values
+}
+_REF_TYPE_VALUE = {
+    value.name: value.number
+    for value in vulnerability_pb2.Reference.Type.DESCRIPTOR.values
+}
+
 
 def _check_valid_severity(prop, value):
   """Check valid severity."""
@@ -65,15 +88,16 @@ def utcnow():
   return datetime.datetime.utcnow()
 
 
-def _get_purl_indexes(affected_packages):
-  """Get list of purls from affected packages, with and without qualifiers"""
-  resulting_set = set()
-  for pkg in affected_packages:
-    if pkg.package.purl:
-      resulting_set.add(pkg.package.purl)
-      if '?' in pkg.package.purl:
-        resulting_set.add(pkg.package.purl.split('?')[0])
-  return list(resulting_set)
+@functools.lru_cache(maxsize=1024)
+def _parse_source_id(source_id):
+  """Parse (and cache) a source_id into a (source name, id) tuple."""
+  return tuple(sources.parse_source_id(source_id))
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_ignore_patterns(patterns):
+  """Compile (and cache) a tuple of SourceRepository ignore patterns."""
+  return [re.compile(pattern) for pattern in patterns]
 
 
 def _repo_name(repo_url: str) -> str:
@@ -243,6 +267,12 @@ class Bug(ndb.Model):
   # Very large fake version to use when there is no fix available.
   _NOT_FIXED_SEMVER = '999999.999999.999999'
 
+  # Pin the ndb cache policy: keep the in-context cache (the default) and opt
+  # out of any global cache, in case one is configured later. No global cache
+  # is configured today, so this doesn't change current behaviour.
+  _use_cache = True
+  _use_global_cache = False
+
   # Display ID as used by the source database. The full qualified database that
   # OSV tracks this as may be different.
   db_id = ndb.StringProperty()
@@ -316,24 +346,29 @@ class Bug(ndb.Model):
       return self.db_id
 
     # TODO(ochang): Remove once all existing bugs have IDs migrated.
-    if re.match(r'^\d+', self.key.id()):
-      return self.OSV_ID_PREFIX + self.key.id()
+    key_id = self.key.id()
+    if _LEADING_DIGITS_RE.match(key_id):
+      return self.OSV_ID_PREFIX + key_id
 
-    return self.key.id()
+    return key_id
 
   @property
   def repo_url(self):
     """Repo URL."""
-    for affected_package in self.affected_packages:
-      for affected_range in affected_package.ranges:
-        if affected_range.repo_url:
-          return affected_range.repo_url
-
-    return None
+    return next((affected_range.repo_url
+                 for affected_package in self.affected_packages
+                 for affected_range in affected_package.ranges
+                 if affected_range.repo_url), None)
 
   @classmethod
   def get_by_id(cls, vuln_id, *args, **kwargs):
     """Overridden get_by_id to handle OSV allocated IDs."""
+    # Fast path: for sources whose db_prefix matches, the key is the ID itself,
+    # so a direct key lookup avoids a datastore query.
+    result = super().get_by_id(vuln_id, *args, **kwargs)
+    if result and result.db_id == vuln_id:
+      return result
+
     result = cls.query(cls.db_id == vuln_id).get()
     if result:
       return result
@@ -344,87 +379,67 @@ class Bug(ndb.Model):
 
     return super().get_by_id(vuln_id, *args, **kwargs)
 
-  def _tokenize(self, value):
-    """Tokenize value for indexing."""
+  @classmethod
+  def query_keys_only(cls, *filters):
+    """Query Bug keys only, without fetching or decoding the entities.
+
+    Callers that need the full entities can pass the keys to ndb.get_multi.
+    """
+    return list(cls.query(*filters).iter(keys_only=True))
+
+  def _tokenize(self, value, out):
+    """Tokenize value for indexing, adding the tokens to the `out` set."""
     if not value:
-      return []
+      return
 
     value_lower = value.lower()
-    return re.split(r'\W+', value_lower) + [value_lower]
+    out.update(_TOKENIZE_RE.split(value_lower))
+    out.add(value_lower)
 
   def _pre_put_hook(self):  # pylint: disable=arguments-differ
     """Pre-put hook for populating search indices."""
     search_indices = set()
 
-    search_indices.update(self._tokenize(self.id()))
-
-    for pkg in self.affected_packages:
-      # Set PURL if it wasn't provided.
-      if not pkg.package.purl:
-        pkg.package.purl = purl_helpers.package_to_purl(
-            ecosystems.normalize(pkg.package.ecosystem), pkg.package.name)
-
-    self.project = list({
-        pkg.package.name for pkg in self.affected_packages if pkg.package.name
-    })
-    self.project.sort()
-
-    ecosystems_set = {
-        pkg.package.ecosystem
-        for pkg in self.affected_packages
-        if pkg.package.ecosystem
-    }
-
-    # Only attempt to add the Git ecosystem if
-    # there are no existing ecosystems present
-    if not ecosystems_set:
-      for pkg in self.affected_packages:
-        for r in pkg.ranges:
-          if r.type == 'GIT':
-            ecosystems_set.add('GIT')
-            break
-        if 'GIT' in ecosystems_set:
-          break
-
-    # For all ecosystems that specify a specific version with colon,
-    # also add the base name
-    ecosystems_set.update({ecosystems.normalize(x) for x in ecosystems_set})
-
-    self.ecosystem = list(ecosystems_set)
-    self.ecosystem.sort()
-
-    self.purl = _get_purl_indexes(self.affected_packages)
-    self.purl.sort()
-
-    for project in self.project:
-      search_indices.update(self._tokenize(project))
-
-    for ecosystem in self.ecosystem:
-      search_indices.update(self._tokenize(ecosystem))
-
-    for alias in self.aliases:
-      search_indices.update(self._tokenize(alias))
-
-    for affected_package in self.affected_packages:
-      for affected_range in affected_package.ranges:
-        if affected_range.repo_url and affected_range.repo_url != '':
-          url_no_https = affected_range.repo_url.split('//')[1]  # remove https
-          repo_url_indices = url_no_https.split('/')[1:]  # remove domain
-          repo_url_indices.append(affected_range.repo_url)  # add full url
-          repo_url_indices.append(url_no_https)  # add url without https://
-          search_indices.update(repo_url_indices)
+    self._tokenize(self.id(), search_indices)
 
-    self.search_indices = list(set(search_indices))
-    self.search_indices.sort()
+    projects_set = set()
+    ecosystems_set = set()
+    purls_set = set()
+    has_git_range = False
 
     self.affected_fuzzy = []
     self.semver_fixed_indexes = []
     self.has_affected = False
     self.is_fixed = False
 
+    # Walk the affected packages once, collecting everything derived from them.
     for affected_package in self.affected_packages:
+      package = affected_package.package
+      name = package.name
+      ecosystem = package.ecosystem
+      purl = package.purl
+
+      # Set PURL if it wasn't provided.
+      if not purl:
+        purl = purl_helpers.package_to_purl(
+            ecosystems.normalize(ecosystem), name)
+        package.purl = purl
+
+      if name:
+        projects_set.add(name)
+        self._tokenize(name, search_indices)
+
+      if ecosystem:
+        ecosystems_set.add(ecosystem)
+
+      # Index purls with and without qualifiers.
+      if purl:
+        purls_set.add(purl)
+        if '?' in purl:
+          purls_set.add(purl.split('?')[0])
+
       # Indexes used for querying by exact version.
-      ecosystem_helper = ecosystems.get(affected_package.package.ecosystem)
+      ecosystem_helper = _get_ecosystem_helper(ecosystem)
       if ecosystem_helper and ecosystem_helper.supports_ordering:
         # No need to normalize if the ecosystem is supported.
         self.affected_fuzzy.extend(affected_package.versions)
@@ -438,6 +453,16 @@ class Bug(ndb.Model):
       self.has_affected |= bool(affected_package.versions)
 
       for affected_range in affected_package.ranges:
+        if affected_range.type == 'GIT':
+          has_git_range = True
+
+        if affected_range.repo_url and affected_range.repo_url != '':
+          url_no_https = affected_range.repo_url.split('//')[1]  # remove https
+          repo_url_indices = url_no_https.split('/')[1:]  # remove domain
+          repo_url_indices.append(affected_range.repo_url)  # add full url
+          repo_url_indices.append(url_no_https)  # add url without https://
+          search_indices.update(repo_url_indices)
+
         fixed_version = None
         for event in affected_range.events:
           # Index used to query by fixed/unfixed.
@@ -456,14 +481,34 @@ class Bug(ndb.Model):
 
         self.has_affected |= (affected_range.type in ('SEMVER', 'ECOSYSTEM'))
 
-    self.affected_fuzzy = list(set(self.affected_fuzzy))
-    self.affected_fuzzy.sort()
+    self.project = sorted(projects_set)
+
+    # Only attempt to add the Git ecosystem if
+    # there are no existing ecosystems present
+    if not ecosystems_set and has_git_range:
+      ecosystems_set.add('GIT')
+
+    # For all ecosystems that specify a specific version with colon,
+    # also add the base name
+    ecosystems_set.update({ecosystems.normalize(x) for x in ecosystems_set})
+
+    self.ecosystem = sorted(ecosystems_set)
+    self.purl = sorted(purls_set)
+
+    for ecosystem in self.ecosystem:
+      self._tokenize(ecosystem, search_indices)
+
+    for alias in self.aliases:
+      self._tokenize(alias, search_indices)
+
+    self.search_indices = sorted(search_indices)
+    self.affected_fuzzy = sorted(set(self.affected_fuzzy))
 
     if not self.last_modified:
       self.last_modified = utcnow()
 
     if self.source_id:
-      self.source, _ = sources.parse_source_id(self.source_id)
+      self.source, _ = _parse_source_id(self.source_id)
 
     if not self.source:
       raise ValueError('Source not specified for Bug.')
@@ -491,8 +536,7 @@ class Bug(ndb.Model):
     self.summary = vulnerability.summary
     self.details = vulnerability.details
     self.reference_url_types = {
-        ref.url: vulnerability_pb2.Reference.Type.Name(ref.type)
-        for ref in vulnerability.references
+        ref.url: _REF_TYPE_NAME[ref.type] for ref in vulnerability.references
     }
 
     if vulnerability.HasField('modified'):
@@ -517,33 +561,33 @@ class Bug(ndb.Model):
       current.ranges = []
 
       for affected_range in affected_package.ranges:
-        current_range = AffectedRange2(
-            type=vulnerability_pb2.Range.Type.Name(affected_range.type),
-            repo_url=affected_range.repo,
-            events=[])
-
+        # Collect events in a plain list and assign them once, rather than
+        # going through the ndb property descriptor for every event.
+        events = []
         for evt in affected_range.events:
           if evt.introduced:
-            current_range.events.append(
+            events.append(
                 AffectedEvent(type='introduced', value=evt.introduced))
             continue
 
           if evt.fixed:
-            current_range.events.append(
-                AffectedEvent(type='fixed', value=evt.fixed))
+            events.append(AffectedEvent(type='fixed', value=evt.fixed))
             continue
 
           if evt.last_affected:
-            current_range.events.append(
+            events.append(
                 AffectedEvent(type='last_affected', value=evt.last_affected))
             continue
 
           if evt.limit:
-            current_range.events.append(
-                AffectedEvent(type='limit', value=evt.limit))
+            events.append(AffectedEvent(type='limit', value=evt.limit))
             continue
 
-        current.ranges.append(current_range)
+        current.ranges.append(
+            AffectedRange2(
+                type=_RANGE_TYPE_NAME[affected_range.type],
+                repo_url=affected_range.repo,
+                events=events))
 
       current.versions = list(affected_package.versions)
       if affected_package.database_specific:
@@ -585,13 +629,11 @@ class Bug(ndb.Model):
 
   def to_vulnerability_minimal(self):
     """Convert to Vulnerability proto (minimal)."""
+    result = vulnerability_pb2.Vulnerability(id=self.id())
     if self.last_modified:
-      modified = timestamp_pb2.Timestamp()
-      modified.FromDatetime(self.last_modified)
-    else:
-      modified = None
+      result.modified.FromDatetime(self.last_modified)
 
-    return vulnerability_pb2.Vulnerability(id=self.id(), modified=modified)
+    return result
 
   def to_vulnerability(self, include_source=False, include_alias=True):
     """Convert to Vulnerability proto."""
@@ -613,7 +655,7 @@ class Bug(ndb.Model):
             events.append(vulnerability_pb2.Event(**kwargs))
 
           current_range = vulnerability_pb2.Range(
-              type=vulnerability_pb2.Range.Type.Value(affected_range.type),
+              type=_RANGE_TYPE_VALUE[affected_range.type],
               repo=affected_range.repo_url,
               events=events)
 
@@ -651,27 +693,7 @@ class Bug(ndb.Model):
 
     details = self.details
 
-    if self.last_modified:
-      modified = timestamp_pb2.Timestamp()
-      modified.FromDatetime(self.last_modified)
-    else:
-      modified = None
-
-    if self.withdrawn:
-      withdrawn = timestamp_pb2.Timestamp()
-      withdrawn.FromDatetime(self.withdrawn)
-    else:
-      withdrawn = None
-
-    published = timestamp_pb2.Timestamp()
-    published.FromDatetime(self.timestamp)
-
-    references = []
-    if self.reference_url_types:
-      for url, url_type in self.reference_url_types.items():
-        references.append(
-            vulnerability_pb2.Reference(
-                url=url, type=vulnerability_pb2.Reference.Type.Value(url_type)))
+    modified = self.last_modified
 
     severity = []
     for entry in self.severities:
@@ -693,29 +715,35 @@ class Bug(ndb.Model):
     if include_alias:
       related_bugs = Bug.query(Bug.related == self.db_id).fetch()
       related_bug_ids = [bug.db_id for bug in related_bugs]
-      related = sorted(list(set(related_bug_ids + self.related)))
+      related = sorted(set(related_bug_ids + self.related))
 
       alias_group = AliasGroup.query(AliasGroup.bug_ids == self.db_id).get()
       if alias_group:
-        aliases = sorted(list(set(alias_group.bug_ids) - {self.db_id}))
-        modified = timestamp_pb2.Timestamp()
-        modified.FromDatetime(
-            max(self.last_modified, alias_group.last_modified))
+        aliases = sorted(set(alias_group.bug_ids) - {self.db_id})
+        modified = max(self.last_modified, alias_group.last_modified)
 
     result = vulnerability_pb2.Vulnerability(
         schema_version=SCHEMA_VERSION,
         id=self.id(),
-        published=published,
-        modified=modified,
         aliases=aliases,
         related=related,
-        withdrawn=withdrawn,
         summary=self.summary,
         details=details,
         affected=affected,
         severity=severity,
-        credits=credits_,
-        references=references)
+        credits=credits_)
+
+    # Add references directly to the result's repeated field.
+    if self.reference_url_types:
+      for url, url_type in self.reference_url_types.items():
+        result.references.add(url=url, type=_REF_TYPE_VALUE[url_type])
+
+    # Populate timestamps in place on the result's sub-messages.
+    result.published.FromDatetime(self.timestamp)
+    if modified:
+      result.modified.FromDatetime(modified)
+    if self.withdrawn:
+      result.withdrawn.FromDatetime(self.withdrawn)
 
     if self.database_specific:
       result.database_specific.update(self.database_specific)
@@ -729,14 +757,14 @@ class Bug(ndb.Model):
         include_source=include_source, include_alias=False)
     alias_group = yield get_aliases_async(vulnerability.id)
     if alias_group:
-      alias_ids = sorted(list(set(alias_group.bug_ids) - {vulnerability.id}))
+      alias_ids = sorted(set(alias_group.bug_ids) - {vulnerability.id})
       vulnerability.aliases[:] = alias_ids
       modified_time = vulnerability.modified.ToDatetime()
       modified_time = max(alias_group.last_modified, modified_time)
       vulnerability.modified.FromDatetime(modified_time)
     related_bug_ids = yield get_related_async(vulnerability.id)
     vulnerability.related[:] = sorted(
-        list(set(related_bug_ids + list(vulnerability.related))))
+        set(related_bug_ids + list(vulnerability.related)))
     return vulnerability
 
 
@@ -839,8 +867,8 @@ class SourceRepository(ndb.Model):
       return False
 
     file_name = os.path.basename(file_path)
-    for pattern in self.ignore_patterns:
-      if re.match(pattern, file_name):
+    for pattern in _compile_ignore_patterns(tuple(self.ignore_patterns)):
+      if pattern.match(file_name):
         return True
 
     return False
@@ -872,17 +900,22 @@ def get_source_repository(source_name):
   return SourceRepository.get_by_id(source_name)
 
 
+@functools.lru_cache(maxsize=None)
+def _get_ecosystem_helper(ecosystem, range_type=None):
+  """Get (and cache) the ecosystem helper for an ecosystem and range type."""
+  if range_type == 'SEMVER':
+    return ecosystems.SemverEcosystem()
+
+  return ecosystems.get(ecosystem)
+
+
 def sorted_events(ecosystem, range_type, events):
   """Sort events."""
   if range_type == 'GIT':
     # No need to sort.
     return events
 
-  if range_type == 'SEMVER':
-    ecosystem_helper = ecosystems.SemverEcosystem()
-  else:
-    ecosystem_helper = ecosystems.get(ecosystem)
-
+  ecosystem_helper = _get_ecosystem_helper(ecosystem, range_type)
   if ecosystem_helper is None or not ecosystem_helper.supports_ordering:
     raise ValueError('Unsupported ecosystem ' + ecosystem)
 
@@ -896,7 +929,10 @@ def sorted_events(ecosystem, range_type, events):
 
     sorted_copy.append(event)
 
-  sorted_copy.sort(key=lambda e: ecosystem_helper.sort_key(e.value))
+  # list.sort computes each key once; hoist the bound method so the key
+  # function doesn't repeat the attribute lookup per event.
+  sort_key = ecosystem_helper.sort_key
+  sorted_copy.sort(key=lambda e: sort_key(e.value))
   if zero_event:
     sorted_copy.insert(0, zero_event)
 
@@ -0,0 +1,48 @@
+# Copyright 2026 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Model tests."""
+
+import unittest
+
+from . import models
+
+
+class SourceRepositoryTest(unittest.TestCase):
+  """SourceRepository tests."""
+
+  def test_ignore_file(self):
+    """Test ignoring files by pattern."""
+    source_repo = models.SourceRepository(
+        ignore_patterns=[r'^(?!GHSA-)', r'.*\.json$'])
+    self.assertTrue(source_repo.ignore_file('/path/to/CVE-2020-1234.yaml'))
+    self.assertTrue(source_repo.ignore_file('/path/to/GHSA-1234.json'))
+    self.assertFalse(source_repo.ignore_file('/path/to/GHSA-1234.yaml'))
+
+  def test_ignore_file_no_patterns(self):
+    """Test that nothing is ignored without patterns."""
+    source_repo = models.SourceRepository()
+    self.assertFalse(source_repo.ignore_file('/path/to/GHSA-1234.yaml'))
+
+  def test_ignore_file_independent_patterns(self):
+    """Test patterns that are only valid when compiled on their own."""
+    source_repo = models.SourceRepository(
+        ignore_patterns=['(?i)readme.*', '(?P<x>a)', '(?P<x>b)', r'(c)\1'])
+    self.assertTrue(source_repo.ignore_file('/path/to/README.md'))
+    self.assertTrue(source_repo.ignore_file('/path/to/b.yaml'))
+    self.assertTrue(source_repo.ignore_file('/path/to/cc.yaml'))
+    self.assertFalse(source_repo.ignore_file('/path/to/GHSA-1234.yaml'))
+
+
+if __name__ == '__main__':
+  unittest.main()
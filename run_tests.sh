@@ -7,6 +7,7 @@ python3 -m pipenv run python -m unittest osv.purl_helpers_test
 python3 -m pipenv run python -m unittest osv.request_helper_test
 python3 -m pipenv run python -m unittest osv.semver_index_test
 python3 -m pipenv run python -m unittest osv.impact_test
+python3 -m pipenv run python -m unittest osv.models_test
 
 # Run all osv.ecosystems tests
 python3 -m pipenv run python -m unittest discover osv/ecosystems/ "*_test.py" .
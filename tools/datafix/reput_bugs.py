@@ -15,12 +15,9 @@ MAX_BATCH_SIZE = 500
 
 def reput_bugs(dryrun: bool, source: str) -> None:
   """ Reput all bugs from a given source."""
-  query = osv.Bug.query()
-  query = query.filter(osv.Bug.source == source)
-  print(f"Running query {query.filters} "
-        f"on {query.kind}...")
+  print(f"Running keys-only query for Bugs with source {source}...")
 
-  result = list(query.fetch(keys_only=True))
+  result = osv.Bug.query_keys_only(osv.Bug.source == source)
   result.sort(key=lambda r: r.id())
   # result = [r for r in result if not r.id()[0].isnumeric()]
   print(f"Retrieved {len(result)} bugs to examine for reputting")
@@ -33,9 +30,7 @@ def reput_bugs(dryrun: bool, source: str) -> None:
     if dryrun:
       print("Dry run mode. Preventing transaction from commiting")
       raise Exception("Dry run mode")  # pylint: disable=broad-exception-raised
-    ndb.put_multi_async([
-        osv.Bug.get_by_id(r.id()) for r in result[batch:batch + MAX_BATCH_SIZE]
-    ])
+    ndb.put_multi_async(ndb.get_multi(result[batch:batch + MAX_BATCH_SIZE]))
     print(f"Time elapsed: {(time.perf_counter() - time_start):.2f} seconds.")
 
   # Chunk the results to reput in acceptibly sized batches for the API.